@@ -1,20 +1,29 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field, validator
-from typing import Optional, Dict, Any
-import openai
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import AfterValidator, BaseModel, BeforeValidator, Field
+from pydantic_core import PydanticCustomError
+from typing import Optional, Dict, Any, Annotated, AsyncIterator, Tuple, List
+from openai import AsyncOpenAI, APIConnectionError, APIError, APIStatusError, InternalServerError, RateLimitError
+import httpx
 import os
 import gspread
 from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import Request
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-import autogen
-import traceback
-import json
+import orjson
 import logging
+import asyncio
+from functools import lru_cache
+import hashlib
+import re
+import random
+import time
+from collections import OrderedDict
 
 # --- Setup Logging ---
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 logger = logging.getLogger(__name__)
@@ -23,10 +32,33 @@ logger = logging.getLogger(__name__)
 # API & GOOGLE SHEETS CONFIGURATION
 #####################################################################################################
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# One shared connection pool for every OpenAI call so requests reuse warm keep-alive connections
+_httpx = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    http2=True,
+    timeout=httpx.Timeout(60.0, connect=5.0),
+)
+
+# Worker processes (uvicorn's --workers also defaults to WEB_CONCURRENCY). Each worker has its own
+# analysis cache and its own share of the OpenAI limits below, so one worker is the default.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# OpenAI throttling. Set these to the account's limits for the model; each worker enforces
+# 1/WEB_CONCURRENCY of them. The defaults match gpt-4o at usage tier 2. A lead makes six calls
+# of roughly 2k tokens each (the shared prompt prefix dominates), so 450k TPM allows ~35 leads/minute.
+OPENAI_MAX_CONCURRENCY = max(1, int(os.getenv("OPENAI_MAX_CONCURRENCY", "20")) // WEB_CONCURRENCY)
+OPENAI_MAX_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_MAX_REQUESTS_PER_MINUTE", "5000")) / WEB_CONCURRENCY
+OPENAI_MAX_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_MAX_TOKENS_PER_MINUTE", "450000")) / WEB_CONCURRENCY
+OPENAI_MAX_ATTEMPTS = 5
+OPENAI_SDK_MAX_RETRIES = 2  # The SDK default, used for calls outside call_agent
 
 app = FastAPI()
 
+@app.on_event("shutdown")
+async def close_http_client():
+    await _httpx.aclose()
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -45,202 +77,793 @@ creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPE
 client = gspread.authorize(creds)
 sheet = client.open_by_key(SHEET_ID).sheet1
 
+# Rows are appended by a background writer so the (blocking) Sheets API call never runs
+# on the request path, and rows that arrive close together go out in a single append.
+SHEET_BATCH_WINDOW = 0.25  # seconds to wait for more rows before appending
+CREDS_REFRESH_INTERVAL = 30 * 60  # seconds; access tokens last an hour
+SHEET_MAX_ATTEMPTS = 5  # quota (429), 5xx and network errors are usually transient
+sheet_queue: "asyncio.Queue[list]" = asyncio.Queue()
+sheet_lock = asyncio.Lock()  # gspread is not thread-safe, so only one Sheets call (or token refresh) at a time
+
+def _log_lost_rows(rows, reason):
+    # The lead data exists nowhere else, so log it in full for manual recovery
+    logger.error("Failed to append %d row(s) to Google Sheets (%s); rows: %s", len(rows), reason, orjson.dumps(rows).decode())
+
+async def _append_rows(rows):
+    """Append rows, retrying with backoff; rows that still can't be written are logged in full."""
+    for attempt in range(SHEET_MAX_ATTEMPTS):
+        try:
+            async with sheet_lock:
+                await asyncio.to_thread(sheet.append_rows, rows, value_input_option="RAW")
+            return
+        except Exception as e:
+            if attempt == SHEET_MAX_ATTEMPTS - 1:
+                _log_lost_rows(rows, e)
+                return
+            delay = 2 ** attempt + random.random()
+            logger.warning("Google Sheets append attempt %d failed (%s); retrying in %.1fs", attempt + 1, e, delay)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            _log_lost_rows(rows, "cancelled while retrying")
+            raise
+
+async def _refresh_creds():
+    """Refresh the service account token ahead of expiry so a write never stalls on (or fails with) a 401."""
+    while True:
+        await asyncio.sleep(CREDS_REFRESH_INTERVAL)
+        try:
+            async with sheet_lock:
+                await asyncio.to_thread(creds.refresh, Request())
+        except Exception as e:
+            logger.error("Failed to refresh Google Sheets credentials: %s", e)
+
+def _drain_sheet_queue(rows):
+    while not sheet_queue.empty():
+        rows.append(sheet_queue.get_nowait())
+    return rows
+
+async def _sheet_writer():
+    while True:
+        rows = [await sheet_queue.get()]
+        try:
+            await asyncio.sleep(SHEET_BATCH_WINDOW)
+        finally:
+            await _append_rows(_drain_sheet_queue(rows))  # Flush even when cancelled at shutdown
+
+@app.on_event("startup")
+async def start_sheet_tasks():
+    app.state.sheet_writer = asyncio.create_task(_sheet_writer())
+    app.state.creds_refresher = asyncio.create_task(_refresh_creds())
+
+@app.on_event("shutdown")
+async def stop_sheet_tasks():
+    app.state.creds_refresher.cancel()
+    app.state.sheet_writer.cancel()
+    try:
+        await app.state.sheet_writer
+    except asyncio.CancelledError:
+        pass
+    rows = _drain_sheet_queue([])
+    if rows:
+        await _append_rows(rows)
+
 ##################################################################################################
-# LEAD DATA MODEL (Pydantic)
+# LEAD DATA MODEL (Pydantic v2)
 ##################################################################################################
 
+# Digits with optional commas; at least one digit is required so "," on its own is rejected.
+# A precompiled single-pass match, with the error messages the lead form shows to users.
+_is_numeric = re.compile(r"\A,*\d[\d,]*\Z").match
+
+def _numeric(message):
+    def check(v):
+        if not _is_numeric(v):
+            raise PydanticCustomError("numeric", message)
+        return v
+    return AfterValidator(check)
+
+def _empty_to_none(v):
+    return None if v == "" else v
+
+NumericStr = Annotated[str, _numeric("Must be a numeric value (commas allowed)")]
+OptionalNumericStr = Annotated[
+    Optional[Annotated[str, _numeric("Must be a numeric value (commas allowed) or empty")]],
+    BeforeValidator(_empty_to_none),
+]
+
 class Lead(BaseModel):
     name: str
-    income: str
-    savings: str
-    credit_score: Optional[str] = None
+    income: NumericStr
+    savings: NumericStr
+    credit_score: OptionalNumericStr = None
     dob: Optional[str] = None
-    lump_sum: Optional[str] = None
-    monthly_contribution: Optional[str] = None
+    lump_sum: OptionalNumericStr = None
+    monthly_contribution: OptionalNumericStr = None
     goals: str
 
-    @validator("income", "savings")
-    def check_numeric(cls, v):
-        if not v.replace(",", "").isdigit():
-            raise ValueError("Must be a numeric value (commas allowed)")
-        return v
-
-    @validator("credit_score", "lump_sum", "monthly_contribution", pre=True, always=True)
-    def check_numeric_optional(cls, v):
-        if v is None or v == "":
-            return None
-        if not v.replace(",", "").isdigit():
-            raise ValueError("Must be a numeric value (commas allowed) or empty")
-        return v
-
 ###################################################################################################
 # AI AGENTS SETUP (Improved System Messages)
 ###################################################################################################
 
-config_list = autogen.config_list_from_json("oai_config_list.json")
+@lru_cache(maxsize=1)
+def llm_config() -> Dict[str, Any]:
+    """Parse oai_config_list.json on first use (not at import) and reuse it for every later call."""
+    import autogen  # Slow to import and only needed to read the config list
 
-def get_llm_config(config_list):
     return {
-        "config_list": config_list,
+        "config_list": autogen.config_list_from_json("oai_config_list.json"),
         "temperature": 0.7,
     }
+
+@lru_cache(maxsize=1)
+def openai_client() -> AsyncOpenAI:
+    """Client for the first oai_config_list.json entry, falling back to OPENAI_API_KEY when it has no api_key."""
+    entry = llm_config()["config_list"][0]
+    return AsyncOpenAI(
+        http_client=_httpx,
+        api_key=entry.get("api_key") or os.getenv("OPENAI_API_KEY"),
+        base_url=entry.get("base_url"),
+        max_retries=0,  # Retries are handled by call_agent so they share its concurrency and rate limits
+    )
+
+def batch_client() -> AsyncOpenAI:
+    """openai_client() with the SDK's own retries, for Batch API and file calls that don't go through call_agent."""
+    return openai_client().with_options(max_retries=OPENAI_SDK_MAX_RETRIES)
+
+@app.on_event("startup")
+async def load_llm_config():
+    # Load it in a worker thread before serving so the first request doesn't block the event loop
+    await asyncio.to_thread(openai_client)
 # --- Agent Definitions (Simplified Prompts, No Markdown) ---
+# Each agent is a single chat completion: agent name -> system message.
+
+# Every system message starts with this identical block and only the agent's role follows it.
+# OpenAI caches prompt prefixes of 1024+ tokens. Each agent's strict response_format schema comes
+# ahead of the system message in that prefix, so the cache is per agent: keeping this block and the
+# role byte-for-byte stable (with the lead details in the user message) lets each agent's calls for
+# later leads reuse the prefix cached by its earlier calls. The first lead's calls all miss.
+SHARED_AGENT_GUIDELINES = """You are one member of a team of specialist agents that reviews leads for The Guz Blueprint. Each lead is a person who filled in a short form on the website. Every agent receives the lead's details in the user message and answers one narrow question about the lead, described under "Your role on the team" at the end of this message. The AntiIULAgent also receives the PolicyAdvisorAgent's output as JSON, after the lead details. Each answer is stored in a spreadsheet next to the lead and read by an advisor.
+
+How the lead details are laid out:
+Lead Details:
+Name: <the person's name as they typed it>
+Income: <annual income in US dollars>
+Savings: <savings in US dollars>
+Credit Score: <credit score, or N/A>
+Date of Birth/Age: <a date of birth or an age in years, or N/A>
+Lump Sum Contribution: <a one-time amount in US dollars, or N/A>
+Monthly Contribution: <an amount in US dollars per month, or N/A>
+Goals: <free text in the person's own words>
+
+Field notes:
+Income, Savings, Credit Score, Lump Sum Contribution and Monthly Contribution contain only digits and commas. Commas are thousands separators, so "1,250" means one thousand two hundred fifty.
+Date of Birth/Age may be written as a full date (for example 1981-04-12 or 04/12/1981), as a year, or as a number of years (for example 29).
+Credit Score, Date of Birth/Age, Lump Sum Contribution and Monthly Contribution are optional on the form. N/A means the person left the field empty; it means unknown, not zero.
+Goals can be a few words or several sentences, and may contain spelling mistakes or questions.
+
+How the AntiIULAgent input is laid out:
+<the lead details exactly as above>
+
+PolicyAdvisorAgent output:
+{"policy_type": "<text>", "reasoning": "<text>"}
+
+Output format rules for every agent:
+1. Reply with exactly one JSON object and nothing else: no markdown, no code fences, and no text before or after the object.
+2. Use exactly the keys of your own output schema below, all of them, and no others.
+3. Every value is a JSON string. Where the schema lists allowed values, use one of them exactly as written, in lower case.
+4. Escape quotes and line breaks inside strings as JSON requires. A line break inside an email body is written as \\n.
+
+Output schemas for the whole team (you only produce the one for your own role):
+LeadQualificationAgent: {"priority": "high" or "low", "reasoning": "<text>"}
+FinancialStrategyAgent: {"budget": "<text>", "investment": "<text>", "savings": "<text>"}
+RiskAssessmentAgent: {"risk_tolerance": "low" or "moderate" or "high", "reasoning": "<text>"}
+PolicyAdvisorAgent: {"policy_type": "<text>", "reasoning": "<text>"}
+AntiIULAgent: {"critique": "<text>"}
+FollowupAgent: {"subject": "<text>", "body": "<text>"}
+
+Worked examples of reading lead details:
+
+Example lead A
+Lead Details:
+Name: Maria Lopez
+Income: 48,000
+Savings: 2,500
+Credit Score: 640
+Date of Birth/Age: 29
+Lump Sum Contribution: N/A
+Monthly Contribution: 150
+Goals: Build an emergency fund and stop living paycheck to paycheck.
+Reading: income is 48000 per year, about 4000 per month; savings are 2500; the credit score is 640; the age is 29; no lump sum was given (unknown); the monthly contribution is 150; the goals mention an emergency fund and month-to-month cash flow.
+
+Example lead B
+Lead Details:
+Name: David Chen
+Income: 185,000
+Savings: 90,000
+Credit Score: 790
+Date of Birth/Age: 1981-04-12
+Lump Sum Contribution: 25,000
+Monthly Contribution: 2,000
+Goals: Retire by 60, pay for two kids' college, and protect my family if something happens to me.
+Reading: income is 185000 per year, about 15400 per month; savings are 90000; the credit score is 790; the date of birth is 12 April 1981, so the age follows from today's date; the lump sum is 25000; the monthly contribution is 2000; the goals name three items: retirement at 60, college for two children, and protection for the family.
+
+Example lead C
+Lead Details:
+Name: Priya Natarajan
+Income: 72,000
+Savings: 15,000
+Credit Score: N/A
+Date of Birth/Age: N/A
+Lump Sum Contribution: 10,000
+Monthly Contribution: N/A
+Goals: Someone told me about IUL as a tax-free retirement plan. Is it right for me?
+Reading: income is 72000 per year, about 6000 per month; savings are 15000; the credit score, the age and the monthly contribution are unknown; the lump sum is 10000; the goals are a question about a specific product.
+
+Example lead D
+Lead Details:
+Name: Jordan Smith
+Income: 36,500
+Savings: 0
+Credit Score: 710
+Date of Birth/Age: 03/02/1995
+Lump Sum Contribution: 0
+Monthly Contribution: 75
+Goals: pay off my credit cards first and then start saving for a house
+Reading: income is 36500 per year, about 3040 per month; savings are 0, which the person entered, so it is known to be zero rather than unknown; the credit score is 710; the date of birth is in 1995 and could be read as 2 March or 3 February, so treat the exact day as uncertain; the lump sum is 0, also entered; the monthly contribution is 75; the goals name two items in order: paying off credit card balances, then saving for a home purchase.
+
+Examples of replies that follow or break the format rules (placeholder text stands in for real content):
+Valid for LeadQualificationAgent: {"priority": "low", "reasoning": "<text>"}
+Invalid, value not in the allowed list: {"priority": "medium", "reasoning": "<text>"}
+Invalid, missing key: {"priority": "high"}
+Invalid, extra key: {"priority": "high", "reasoning": "<text>", "score": "8"}
+Invalid, wrapped in a code fence or preceded by a sentence such as "Here is my answer:".
+Valid for RiskAssessmentAgent: {"risk_tolerance": "moderate", "reasoning": "<text>"}
+Invalid, number instead of string: {"risk_tolerance": 2, "reasoning": "<text>"}
+Valid for FollowupAgent: {"subject": "<text>", "body": "<first paragraph>\\n\\n<second paragraph>"}
+Invalid, body split into a list: {"subject": "<text>", "body": ["<first paragraph>", "<second paragraph>"]}
+
+Your role on the team:
+"""
+
+AGENT_ROLES = {
+    "LeadQualificationAgent": """Lead Qualification Expert: Assess lead priority (high/low) and provide reasoning.
+    Output JSON: {"priority": "high/low", "reasoning": "reason"}""",
+
+    "FinancialStrategyAgent": """Financial Strategist: Provide budget, investment, and savings advice.
+    Output JSON: {"budget": "advice", "investment": "advice", "savings": "advice"}""",
+
+    "PolicyAdvisorAgent": """Insurance Policy Expert: Recommend a life insurance policy.
+    Output JSON: {"policy_type": "policy type", "reasoning": "reason"}""",
+
+    "AntiIULAgent": """IUL/VUL Skeptic: Critique the PolicyAdvisorAgent's recommendation, highlighting risks.
+    Output JSON: {"critique": "critique"}""",
+
+    "RiskAssessmentAgent": """Risk Assessment Expert: Assess the client's risk tolerance (low/moderate/high).
+    Consider their lump sum and monthly contributions in addition to income, savings, and goals.
+    Output JSON: {"risk_tolerance": "low/moderate/high", "reasoning": "reasoning"}""",
 
-lead_qualification_agent = autogen.AssistantAgent(
-    name="LeadQualificationAgent",
-    llm_config=get_llm_config(config_list),
-    system_message="""Lead Qualification Expert: Assess lead priority (high/low) and provide reasoning.
-    Output JSON: {"priority": "high/low", "reasoning": "reason"}"""
-)
+    "FollowupAgent": """Follow-up Email Specialist: Draft a professional follow-up email.
+    Output JSON: {"subject": "subject", "body": "body"}""",
+}
 
-financial_strategy_agent = autogen.AssistantAgent(
-    name="FinancialStrategyAgent",
-    llm_config=get_llm_config(config_list),
-    system_message="""Financial Strategist: Provide budget, investment, and savings advice.
-    Output JSON: {"budget": "advice", "investment": "advice", "savings": "advice"}"""
-)
+AGENT_SYSTEM = {name: SHARED_AGENT_GUIDELINES + role for name, role in AGENT_ROLES.items()}
 
-policy_advisor_agent = autogen.AssistantAgent(
-    name="PolicyAdvisorAgent",
-    llm_config=get_llm_config(config_list),
-    system_message="""Insurance Policy Expert: Recommend a life insurance policy.
-    Output JSON: {"policy_type": "policy type", "reasoning": "reason"}"""
-)
+# The agents form a two-stage DAG: stage one only needs the lead details, and each
+# stage-two agent runs on the output of the stage-one agent it depends on.
+STAGE_ONE_AGENTS = ("LeadQualificationAgent", "FinancialStrategyAgent", "RiskAssessmentAgent", "PolicyAdvisorAgent", "FollowupAgent")
+STAGE_TWO_AGENTS = {"PolicyAdvisorAgent": "AntiIULAgent"}  # dependency -> dependent agent
 
-anti_iul_agent = autogen.AssistantAgent(
-    name="AntiIULAgent",
-    llm_config=get_llm_config(config_list),
-    system_message="""IUL/VUL Skeptic: Critique the PolicyAdvisorAgent's recommendation, highlighting risks.
-    Output JSON: {"critique": "critique"}"""
-)
+# --- Structured Output Schemas (the API guarantees each reply matches its agent's schema) ---
 
-risk_assessment_agent = autogen.AssistantAgent(
-    name="RiskAssessmentAgent",
-    llm_config=get_llm_config(config_list),
-    system_message="""Risk Assessment Expert: Assess the client's risk tolerance (low/moderate/high).
-    Consider their lump sum and monthly contributions in addition to income, savings, and goals.
-    Output JSON: {"risk_tolerance": "low/moderate/high", "reasoning": "reasoning"}"""
-)
+def _json_schema(name, **fields):
+    """Strict JSON schema response_format; a field maps to None for free text or a list of allowed values."""
+    properties = {
+        field: {"type": "string", "enum": values} if values else {"type": "string"}
+        for field, values in fields.items()
+    }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(fields),
+                "additionalProperties": False,
+            },
+        },
+    }
 
-followup_agent = autogen.AssistantAgent(
-    name="FollowupAgent",
-    llm_config=get_llm_config(config_list),
-    system_message="""Follow-up Email Specialist: Draft a professional follow-up email.
-    Output JSON: {"subject": "subject", "body": "body"}"""
-)
+RESPONSE_FORMATS = {
+    "LeadQualificationAgent": _json_schema("lead_qualification", priority=["high", "low"], reasoning=None),
+    "FinancialStrategyAgent": _json_schema("financial_strategy", budget=None, investment=None, savings=None),
+    "PolicyAdvisorAgent": _json_schema("policy", policy_type=None, reasoning=None),
+    "AntiIULAgent": _json_schema("anti_iul_critique", critique=None),
+    "RiskAssessmentAgent": _json_schema("risk_assessment", risk_tolerance=["low", "moderate", "high"], reasoning=None),
+    "FollowupAgent": _json_schema("followup", subject=None, body=None),
+}
 
 ################################################################################################
 # AI QUALIFICATION & ANALYSIS PIPELINE (Refactored for Clarity and Robustness)
 ################################################################################################
-async def process_lead_pipeline(lead: Lead):
-    try:
-        # --- 1. Data Validation (Handled by Pydantic) ---
-
-        # --- 2. Initiate Autogen Chat ---
-        user_proxy = autogen.UserProxyAgent(
-            name="User",
-            human_input_mode="NEVER",
-            code_execution_config=False,
-            default_auto_reply="OK.",  # Autogen requires a default auto-reply
-            is_termination_msg=lambda x: x.get("content", "").strip().lower().endswith("terminate") # Changed termination message
-        )
-
-        # Define the GroupChat
-        groupchat = autogen.GroupChat(
-            agents=[lead_qualification_agent, financial_strategy_agent, risk_assessment_agent, policy_advisor_agent, anti_iul_agent, followup_agent],
-            messages=[],
-            max_round=12,  # Allow for sufficient rounds
-            speaker_selection_method="round_robin"
-        )
-        manager = autogen.GroupChatManager(groupchat=groupchat, llm_config=get_llm_config(config_list))
-        #Important:
-        manager.max_round = 1 # Only one round of conversation
-
-        # Construct the initial message
-        initial_message = (
-            f"Process the following lead and generate structured responses as follows:\n"
-            f"- LeadQualificationAgent: Assess lead priority (high/low) and provide reasoning.\n"
-            f"- FinancialStrategyAgent: Provide budgeting, investment, and savings strategies.\n"
-            f"- RiskAssessmentAgent: Evaluate risk tolerance, considering lump sum/monthly contributions.\n"
-            f"- PolicyAdvisorAgent: Recommend the most suitable life insurance policy.\n"
-            f"- AntiIULAgent: Critique any IUL or VUL policies.\n"
-            f"- FollowupAgent: Draft a follow-up email.\n\n"
-            f"Lead Details:\n"
-            f"Name: {lead.name}\n"
-            f"Income: {lead.income}\n"
-            f"Savings: {lead.savings}\n"
-            f"Credit Score: {lead.credit_score if lead.credit_score else 'N/A'}\n"
-            f"Date of Birth/Age: {lead.dob if lead.dob else 'N/A'}\n"
-            f"Lump Sum Contribution: {lead.lump_sum if lead.lump_sum else 'N/A'}\n"
-            f"Monthly Contribution: {lead.monthly_contribution if lead.monthly_contribution else 'N/A'}\n"
-            f"Goals: {lead.goals}\n\n"
-            "TERMINATE"  # Add termination message
-        )
-
-        # Start the chat
-        await user_proxy.a_initiate_chat(manager, message=initial_message)
-
-        # --- 3. Extract and Process Responses ---
-        results: Dict[str, Any] = {}  # Use a dictionary to store results
-
-        logger.debug("groupchat.messages: %s", groupchat.messages)
-
-        for message in groupchat.messages:
-            if message['role'] == 'assistant':
-                agent_name = message['name']
-                content = message.get('content', '')
-                logger.debug(f"Processing message from {agent_name}: {content}")
+LEAD_DETAILS_TEMPLATE = (
+    "Lead Details:\n"
+    "Name: {name}\n"
+    "Income: {income}\n"
+    "Savings: {savings}\n"
+    "Credit Score: {credit_score}\n"
+    "Date of Birth/Age: {dob}\n"
+    "Lump Sum Contribution: {lump_sum}\n"
+    "Monthly Contribution: {monthly_contribution}\n"
+    "Goals: {goals}"
+)
+
+class RateLimiter:
+    """Request and token budgets per minute, refilled continuously (after the OpenAI cookbook's
+    api_request_parallel_processor), so bursts wait for capacity instead of hitting 429s."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = requests_per_minute
+        self.available_tokens = tokens_per_minute
+        self.last_update = time.monotonic()
+        self.lock = asyncio.Lock()  # Acquirers are served one at a time, in arrival order
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self.last_update) / 60
+        self.available_requests = min(self.requests_per_minute, self.available_requests + self.requests_per_minute * elapsed_minutes)
+        self.available_tokens = min(self.tokens_per_minute, self.available_tokens + self.tokens_per_minute * elapsed_minutes)
+        self.last_update = now
+
+    async def acquire(self, tokens: int):
+        tokens = min(tokens, self.tokens_per_minute)  # A single oversized request must still be able to run
+        async with self.lock:
+            self._refill()
+            # Sleep exactly until both budgets have refilled enough, instead of polling
+            wait_minutes = max(
+                (1 - self.available_requests) / self.requests_per_minute,
+                (tokens - self.available_tokens) / self.tokens_per_minute,
+            )
+            if wait_minutes > 0:
+                await asyncio.sleep(wait_minutes * 60)
+                self._refill()
+            self.available_requests -= 1
+            self.available_tokens -= tokens
+
+openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+openai_rate_limiter = RateLimiter(OPENAI_MAX_REQUESTS_PER_MINUTE, OPENAI_MAX_TOKENS_PER_MINUTE)
+COMPLETION_TOKEN_ESTIMATE = 300  # Expected reply size, counted against the token budget up front
+
+def _estimate_tokens(system_message: str, user_message: str) -> int:
+    return (len(system_message) + len(user_message)) // 4 + COMPLETION_TOKEN_ESTIMATE  # ~4 characters per token
+
+def _chat_request(agent_name: str, user_message: str) -> Dict[str, Any]:
+    """Chat completion parameters for one agent call (shared by live calls and the Batch API)."""
+    config = llm_config()
+    return {
+        "model": config["config_list"][0]["model"],
+        "temperature": config["temperature"],
+        "response_format": RESPONSE_FORMATS[agent_name],
+        "messages": [
+            {"role": "system", "content": AGENT_SYSTEM[agent_name]},
+            {"role": "user", "content": user_message},
+        ],
+    }
 
+def _is_retryable(e: Exception) -> bool:
+    """The failures the SDK itself retries: connection errors and timeouts, 408, 409, 429 and 5xx."""
+    if isinstance(e, (APIConnectionError, RateLimitError, InternalServerError)):
+        return True
+    return isinstance(e, APIStatusError) and e.status_code in (408, 409)
+
+def _parse_reply(agent_name: str, content: Optional[str], refusal: Optional[str]) -> Dict[str, Any]:
+    if refusal:
+        raise ValueError(f"{agent_name} refused: {refusal}")
+    return orjson.loads(content)
+
+async def call_agent(agent_name: str, user_message: str) -> Dict[str, Any]:
+    """Run a single agent as one chat completion and return its parsed JSON output."""
+    request = _chat_request(agent_name, user_message)
+    tokens = _estimate_tokens(AGENT_SYSTEM[agent_name], user_message)
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        # Wait for rate budget (and back off) without holding a concurrency slot
+        await openai_rate_limiter.acquire(tokens)
+        try:
+            async with openai_semaphore:
+                response = await openai_client().chat.completions.create(**request)
+            break
+        except APIError as e:
+            if not _is_retryable(e) or attempt == OPENAI_MAX_ATTEMPTS - 1:
+                raise
+            delay = 2 ** attempt + random.random()
+            logger.warning("Agent %s attempt %d failed (%s); retrying in %.1fs", agent_name, attempt + 1, e, delay)
+            await asyncio.sleep(delay)
+
+    message = response.choices[0].message
+    return _parse_reply(agent_name, message.content, message.refusal)
+
+def format_lead_details(lead: Lead) -> str:
+    """The lead block sent as the user message; built once per lead and shared by all of its agent calls."""
+    return LEAD_DETAILS_TEMPLATE.format(
+        name=lead.name,
+        income=lead.income,
+        savings=lead.savings,
+        credit_score=lead.credit_score or "N/A",
+        dob=lead.dob or "N/A",
+        lump_sum=lead.lump_sum or "N/A",
+        monthly_contribution=lead.monthly_contribution or "N/A",
+        goals=lead.goals,
+    )
+
+def format_dependent_input(lead_details: str, dependency: str, result: Dict[str, Any]) -> str:
+    """User message for a stage-two agent: the lead details followed by the output it depends on."""
+    return f"{lead_details}\n\n{dependency} output:\n{orjson.dumps(result).decode()}"
+
+async def iter_agent_results(lead: Lead) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Run every agent for a lead, yielding (agent name, parsed output) as each agent succeeds.
+
+    A failed stage-one agent (e.g. an auth error or an outage that outlasted the retries) fails the
+    whole lead, so no empty analysis is returned or stored. A failed stage-two agent falls back to N/A.
+    """
+    # Stage-two agents start as soon as the agent they depend on finishes, not after all of stage one.
+    lead_details = format_lead_details(lead)
+
+    tasks = {asyncio.create_task(call_agent(name, lead_details)): name for name in STAGE_ONE_AGENTS}
+
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks.pop(task)
                 try:
-                    # More Robust JSON Parsing: Check if content looks like JSON
-                    parsed_content = json.loads(content) if content.strip().startswith("{") and content.strip().endswith("}") else {}
-                    if parsed_content:
-                        results[agent_name] = parsed_content
-                    else:
-                        logger.warning(f"Agent {agent_name} returned malformed JSON.")
-                        results[agent_name] = {"error": "Malformed JSON from AI"}
-                except json.JSONDecodeError:
-                    logger.error(f"JSONDecodeError for {agent_name}. Content: {content}")
-                    results[agent_name] = {"error": "Invalid JSON from AI"}  # More informative error
+                    result = task.result()
+                except Exception as e:
+                    if name in STAGE_ONE_AGENTS:
+                        raise
+                    logger.error("Agent %s failed: %s", name, e)
+                    continue
+                dependent = STAGE_TWO_AGENTS.get(name)
+                if dependent:
+                    dependent_input = format_dependent_input(lead_details, name, result)
+                    tasks[asyncio.create_task(call_agent(dependent, dependent_input))] = dependent
+                yield name, result
+    finally:
+        for task in tasks:  # Only left over if the consumer stopped early (e.g. a client disconnect)
+            task.cancel()
+
+async def run_agents(lead: Lead) -> Dict[str, Any]:
+    """Run every agent for a lead, returning the parsed output of each agent that succeeded."""
+    return {name: result async for name, result in iter_agent_results(lead)}
+
+# ai_analysis section for each agent, and what a section holds when its agent failed.
+# The default dicts are shared between responses, which is safe because nothing mutates them.
+_KEY_MAP = {
+    "LeadQualificationAgent": "qualification",
+    "FinancialStrategyAgent": "financial_strategy",
+    "PolicyAdvisorAgent": "policy",
+    "AntiIULAgent": "anti_iul_critique",
+    "RiskAssessmentAgent": "risk_assessment",
+    "FollowupAgent": "followup",
+}
+_DEFAULTS = {
+    "qualification": {"priority": "N/A", "reasoning": "N/A"},
+    "financial_strategy": {"budget": "N/A", "investment": "N/A", "savings": "N/A"},
+    "policy": {"policy_type": "N/A", "reasoning": "N/A"},
+    "anti_iul_critique": {"critique": "N/A"},
+    "risk_assessment": {"risk_tolerance": "N/A", "reasoning": "N/A"},
+    "followup": {"subject": "N/A", "body": "N/A"},
+}
+
+def combine_results(results: Dict[str, Any]) -> Dict[str, Any]:
+    """Map agent outputs onto the ai_analysis sections, with N/A fallbacks for failed agents."""
+    ai_analysis = dict(_DEFAULTS)
+    ai_analysis.update({_KEY_MAP[name]: result for name, result in results.items()})
+    return ai_analysis
+
+async def store_lead(lead: Lead, ai_analysis_json: str):
+    """Queue the lead and its analysis for the background Google Sheets writer."""
+    await sheet_queue.put([
+        lead.name,
+        lead.income,
+        lead.savings,
+        lead.credit_score or "N/A",
+        lead.dob or "N/A",
+        lead.lump_sum or "N/A",
+        lead.monthly_contribution or "N/A",
+        lead.goals,
+        ai_analysis_json  # Store the ENTIRE ai_analysis as a JSON string
+    ])
+
+# --- Analysis Cache (LRU, keyed by a hash of the lead) ---
+ANALYSIS_CACHE_SIZE = 1024
+analysis_cache: "OrderedDict[str, str]" = OrderedDict()  # cache key -> ai_analysis JSON string
+
+def analysis_cache_key(lead: Lead) -> str:
+    return hashlib.blake2b(orjson.dumps(lead.model_dump(), option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def analysis_cache_get(key: str) -> Optional[str]:
+    ai_analysis_json = analysis_cache.get(key)
+    if ai_analysis_json is not None:
+        analysis_cache.move_to_end(key)
+    return ai_analysis_json
+
+def analysis_cache_put(key: str, ai_analysis_json: str):
+    analysis_cache[key] = ai_analysis_json
+    analysis_cache.move_to_end(key)
+    if len(analysis_cache) > ANALYSIS_CACHE_SIZE:
+        analysis_cache.popitem(last=False)
+
+def record_analysis(cache_key: str, results: Dict[str, Any]) -> str:
+    """Combine agent results into the ai_analysis JSON string, caching it when every agent succeeded."""
+    ai_analysis = combine_results(results)
+    logger.debug("Final ai_analysis: %s", ai_analysis)
+    ai_analysis_json = orjson.dumps(ai_analysis).decode()
+
+    # Only cache complete analyses so a transient agent failure is retried next time
+    if len(results) == len(AGENT_SYSTEM):
+        analysis_cache_put(cache_key, ai_analysis_json)
+    return ai_analysis_json
+
+async def process_lead_pipeline(lead: Lead) -> Dict[str, Any]:
+    # --- 1. Data Validation (Handled by Pydantic) ---
+
+    # --- 2. Reuse a Previous Analysis of the Same Lead ---
+    cache_key = analysis_cache_key(lead)
+    ai_analysis_json = analysis_cache_get(cache_key)
+    cached = ai_analysis_json is not None
+
+    if not cached:
+        # --- 3. Run Agents ---
+        results = await run_agents(lead)
 
         # --- 4. Combine Results (with Fallbacks) ---
-        ai_analysis = {
-            "qualification": results.get("LeadQualificationAgent", {"priority": "N/A", "reasoning": "N/A"}),
-            "financial_strategy": results.get("FinancialStrategyAgent", {"budget": "N/A", "investment": "N/A", "savings": "N/A"}),
-            "policy": results.get("PolicyAdvisorAgent", {"policy_type": "N/A", "reasoning": "N/A"}),
-            "anti_iul_critique": results.get("AntiIULAgent", {"critique": "N/A"}),
-            "risk_assessment": results.get("RiskAssessmentAgent", {"risk_tolerance": "N/A", "reasoning": "N/A"}),
-            "followup": results.get("FollowupAgent", {"subject": "N/A", "body": "N/A"}),
-        }
-        logger.debug("Final ai_analysis: %s", ai_analysis)
-
-        # --- 5. Store Results (Google Sheets) ---
-        sheet.append_row([
-            lead.name,
-            lead.income,
-            lead.savings,
-            lead.credit_score if lead.credit_score else "N/A",
-            lead.dob if lead.dob else "N/A",
-            lead.lump_sum if lead.lump_sum else "N/A",
-            lead.monthly_contribution if lead.monthly_contribution else "N/A",
-            lead.goals,
-            json.dumps(ai_analysis)  # Store the ENTIRE ai_analysis as a JSON string
-        ])
-
-        # --- 6. Return Results ---
-        return {"status": "success", "message": "Lead processed successfully!", "ai_analysis": json.dumps(ai_analysis)}
-
-    except HTTPException as e:
-        return {"status": "error", "message": str(e.detail)}
-    except Exception as e:
-        error_message = f"Error processing lead: {str(e)}\n{traceback.format_exc()}"
-        logger.error(error_message)
-        return {"status": "error", "message": "Internal Server Error."}
+        ai_analysis_json = record_analysis(cache_key, results)
+
+    # --- 5. Store Results (Google Sheets, written in the background) ---
+    await store_lead(lead, ai_analysis_json)
+
+    # --- 6. Return Results ---
+    return {"status": "success", "message": "Lead processed successfully!", "ai_analysis": ai_analysis_json, "cached": cached}
+
+PIPELINE_ERROR = {"status": "error", "message": "Internal Server Error."}
+
+def _sse_event(event: str, payload: Any) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(payload).decode()}\n\n"
+
+async def stream_lead_pipeline(lead: Lead) -> AsyncIterator[str]:
+    """Same as process_lead_pipeline, but emits each agent's output as a server-sent event as soon as it arrives."""
+    try:
+        cache_key = analysis_cache_key(lead)
+        ai_analysis_json = analysis_cache_get(cache_key)
+        cached = ai_analysis_json is not None
+
+        if not cached:
+            results: Dict[str, Any] = {}
+            async for name, result in iter_agent_results(lead):
+                results[name] = result
+                yield _sse_event(name, result)
+
+            ai_analysis_json = record_analysis(cache_key, results)
+
+        await store_lead(lead, ai_analysis_json)
+        yield _sse_event("done", {"status": "success", "ai_analysis": orjson.loads(ai_analysis_json), "cached": cached})
+
+    except Exception:
+        logger.exception("stream_lead_pipeline failed", extra={"lead_name": lead.name})
+        yield _sse_event("error", PIPELINE_ERROR)
+
+# --- Bulk Processing with the OpenAI Batch API (50% cheaper, results within 24h) ---
+# Stage-one agents for every lead go into one batch. Finalizing it submits the stage-two agents
+# (which need stage-one output) as a second batch, and finalizing that one stores every lead.
+# Between steps the leads and partial results are kept in PENDING_BATCH_DIR under the current
+# batch ID, so finalize can be driven by a client or a separate poller.
+# While a batch is being finalized its file is renamed to <batch_id>.json.finalizing, and finalize
+# answers 409 for it. If the process dies mid-finalize that file stays behind; once the batch's
+# stage-two batch (if any) has been checked in the logs, rename it back to <batch_id>.json to retry.
+# The files contain lead details, so the directory must not be committed or publicly readable.
+PENDING_BATCH_DIR = os.path.abspath(
+    os.getenv("PENDING_BATCH_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pending_batches"))
+)
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def _pending_batch_path(batch_id: str) -> str:
+    return os.path.join(PENDING_BATCH_DIR, f"{os.path.basename(batch_id)}.json")
+
+def _write_pending(path: str, pending: Dict[str, Any]):
+    os.makedirs(PENDING_BATCH_DIR, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(pending))
+
+def _read_pending(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+async def _submit_batch(requests: List[Tuple[str, str, str]]) -> str:
+    """Submit (custom_id, agent name, user message) requests as one OpenAI batch and return its ID."""
+    lines = [
+        orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _chat_request(name, user_message),
+        })
+        for custom_id, name, user_message in requests
+    ]
+    input_file = await batch_client().files.create(file=("leads.jsonl", b"\n".join(lines)), purpose="batch")
+    batch = await batch_client().batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    return batch.id
+
+async def submit_lead_batch(leads: List[Lead]) -> str:
+    """Submit the stage-one agent calls for every lead as one OpenAI batch and return its ID."""
+    batch_id = await _submit_batch([
+        (f"{index}:{name}", name, format_lead_details(lead))
+        for index, lead in enumerate(leads)
+        for name in STAGE_ONE_AGENTS
+    ])
+    pending = {"stage": 1, "leads": [lead.model_dump() for lead in leads]}
+    await asyncio.to_thread(_write_pending, _pending_batch_path(batch_id), pending)
+    return batch_id
+
+async def _read_batch_results(batch, results: List[Dict[str, Any]]):
+    """Add the parsed agent outputs of a finished batch to results, including the partial output of an expired or cancelled one."""
+    if batch.output_file_id:
+        output = await batch_client().files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            item = orjson.loads(line)
+            index, name = item["custom_id"].split(":", 1)
+            response = item.get("response") or {}
+            if response.get("status_code") != 200:
+                logger.error("Batch %s: agent %s failed for lead %s: %s", batch.id, name, index, item.get("error"))
+                continue
+            message = response["body"]["choices"][0]["message"]
+            try:
+                results[int(index)][name] = _parse_reply(name, message.get("content"), message.get("refusal"))
+            except Exception as e:
+                logger.error("Batch %s: agent %s failed for lead %s: %s", batch.id, name, index, e)
+
+    if batch.error_file_id:
+        errors = await batch_client().files.content(batch.error_file_id)
+        for line in errors.text.splitlines():
+            item = orjson.loads(line)
+            logger.error("Batch %s: request %s failed: %s", batch.id, item.get("custom_id"), item.get("error") or item.get("response"))
+
+async def _remove_claimed(claimed_path: str):
+    # The batch has been advanced at this point, so a leftover file only needs cleaning up
+    try:
+        await asyncio.to_thread(os.remove, claimed_path)
+    except OSError as e:
+        logger.warning("Could not remove %s: %s", claimed_path, e)
+
+async def finalize_lead_batch(batch_id: str) -> Dict[str, Any]:
+    """Advance a finished batch: submit the stage-two batch after stage one, or cache and store every lead after stage two.
+
+    Leads whose agents did not finish (a failed, expired or cancelled batch) are stored with N/A sections.
+    """
+    path = _pending_batch_path(batch_id)
+    claimed_path = f"{path}.finalizing"
+    if not os.path.exists(path):
+        if os.path.exists(claimed_path):
+            raise HTTPException(status_code=409, detail=f"Batch is being finalized: {batch_id}")
+        raise HTTPException(status_code=404, detail=f"Unknown or already finalized batch: {batch_id}")
+
+    batch = await batch_client().batches.retrieve(batch_id)
+    if batch.status not in BATCH_TERMINAL_STATUSES:
+        return {"status": batch.status, "batch_id": batch_id}
+
+    # Claim the batch atomically so concurrent finalize calls can't store the leads twice
+    try:
+        await asyncio.to_thread(os.rename, path, claimed_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=409, detail=f"Batch is being finalized: {batch_id}")
+
+    next_batch_id = None
+    try:
+        pending = await asyncio.to_thread(_read_pending, claimed_path)
+        leads = [Lead(**lead) for lead in pending["leads"]]
+        results: List[Dict[str, Any]] = pending.get("results") or [{} for _ in leads]
+        await _read_batch_results(batch, results)
+
+        if pending["stage"] == 1:
+            stage_two = [
+                (f"{index}:{dependent}", dependent, format_dependent_input(format_lead_details(lead), dependency, results[index][dependency]))
+                for index, lead in enumerate(leads)
+                for dependency, dependent in STAGE_TWO_AGENTS.items()
+                if dependency in results[index]
+            ]
+            if stage_two:
+                next_batch_id = await _submit_batch(stage_two)
+    except Exception:
+        await asyncio.to_thread(os.rename, claimed_path, path)  # Release the claim so the batch can be finalized again
+        raise
+
+    if next_batch_id:
+        # The stage-two batch exists (and is billed) now, so the claim is kept from here on:
+        # releasing it would let the next finalize call submit the stage-two batch a second time.
+        logger.info("Batch %s: submitted stage-two batch %s", batch_id, next_batch_id)
+        next_pending = {"stage": 2, "leads": pending["leads"], "results": results}
+        try:
+            await asyncio.to_thread(_write_pending, _pending_batch_path(next_batch_id), next_pending)
+        except Exception:
+            logger.exception("Batch %s: could not save stage-two batch %s; %s is left claimed", batch_id, next_batch_id, claimed_path)
+            raise
+        await _remove_claimed(claimed_path)
+        return {"status": "stage_two_submitted", "batch_id": batch_id, "batch_status": batch.status, "next_batch_id": next_batch_id}
+
+    analyses = []
+    for lead, lead_results in zip(leads, results):
+        ai_analysis_json = record_analysis(analysis_cache_key(lead), lead_results)
+        await store_lead(lead, ai_analysis_json)
+        analyses.append({"name": lead.name, "ai_analysis": ai_analysis_json})
+
+    await _remove_claimed(claimed_path)
+    return {"status": "success", "batch_id": batch_id, "batch_status": batch.status, "results": analyses}
 
 ####################################################################################################
-# API ENDPOINT
+# API ENDPOINTS
 ####################################################################################################
 
-@app.post("/process-lead")
+# Every lead costs several OpenAI calls, so the bulk endpoints take a bounded, non-empty list.
+# Live leads hold the request open until all of them finish; batches run in the background.
+MAX_LIVE_LEADS = 20
+MAX_BATCH_LEADS = 2000
+LiveLeads = Annotated[List[Lead], Field(min_length=1, max_length=MAX_LIVE_LEADS)]
+BatchLeads = Annotated[List[Lead], Field(min_length=1, max_length=MAX_BATCH_LEADS)]
+
+@app.post("/process-lead", response_class=ORJSONResponse)
 async def process_lead(lead: Lead):
-    return await process_lead_pipeline(lead)
\ No newline at end of file
+    try:
+        return await process_lead_pipeline(lead)
+    except Exception:
+        logger.exception("process_lead_pipeline failed", extra={"lead_name": lead.name})
+        return ORJSONResponse(status_code=500, content=PIPELINE_ERROR)
+
+@app.post("/process-lead/stream")
+async def process_lead_stream(lead: Lead):
+    return StreamingResponse(stream_lead_pipeline(lead), media_type="text/event-stream")
+
+@app.post("/process-leads", response_class=ORJSONResponse)
+async def process_leads(leads: LiveLeads):
+    # Leads run concurrently; call_agent's semaphore and rate limiter are shared across all of them
+    results = await asyncio.gather(*(process_lead_pipeline(lead) for lead in leads), return_exceptions=True)
+    # A failed lead is reported in its own entry instead of failing the whole request
+    entries = []
+    for lead, result in zip(leads, results):
+        if isinstance(result, Exception):
+            logger.error("process_lead_pipeline failed", exc_info=result, extra={"lead_name": lead.name})
+            result = PIPELINE_ERROR
+        entries.append(result)
+    return entries
+
+@app.post("/process-leads/batch", response_class=ORJSONResponse)
+async def process_leads_batch(leads: BatchLeads):
+    return {"status": "submitted", "batch_id": await submit_lead_batch(leads)}
+
+@app.post("/process-leads/batch/{batch_id}/finalize", response_class=ORJSONResponse)
+async def finalize_leads_batch(batch_id: str):
+    return await finalize_lead_batch(batch_id)
+
+####################################################################################################
+# ENTRY POINT
+####################################################################################################
+
+if __name__ == "__main__":
+    # Equivalent to: uvicorn server:app --loop uvloop --http httptools --workers $WEB_CONCURRENCY
+    # One async worker handles many concurrent leads since the work is I/O-bound. More workers
+    # split the analysis cache and the OpenAI limits between them (see WEB_CONCURRENCY above).
+    import uvicorn
+    uvicorn.run(
+        "server:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        loop="auto",  # uvloop when installed
+        http="auto",  # httptools when installed
+        workers=WEB_CONCURRENCY,
+    )